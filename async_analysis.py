@@ -5,15 +5,23 @@ import os
 import argparse
 import datetime
 import logging
-
-import asyncio
-
-import chess
-import chess.pgn
-import chess.engine
+import json
 
 import constants as const
 from constants import Category
+import config as conf
+import early_stop
+from lazy import lazy_import
+
+# Nothing heavy (python-chess, asyncio, the engines) is loaded until analysis
+# actually starts, so --help is quick and this can be imported as a module.
+chess = lazy_import('chess')
+autotune = lazy_import('autotune')
+engine_pool = lazy_import('engine_pool')
+scheduler = lazy_import('scheduler')
+prescreen = lazy_import('prescreen')
+cache = lazy_import('cache')
+player_stats = lazy_import('player_stats')
 
 class Complete_Board:
     def __init__(self, game):
@@ -50,40 +58,54 @@ class Complete_Board:
         else:
             return self.board.move_stack[curr_ply-1].uci()
 
-if not const.LOG_DIR:
-    const.LOG_DIR = '.'
-elif not os.path.exists(const.LOG_DIR):
-    try:
-        os.mkdir(const.LOG_DIR)
-    except OSError as error:
-        print(error)
-        os._exit(1)
-
-parser = argparse.ArgumentParser(description="Arg Parse Stuff")
-
-parser.add_argument("-f", "--file", help="PGN file to parse")
-parser.add_argument("-e", "--elo", type=int, help="Set engine ELO")
-parser.add_argument("-d", "--depth", type=int, help="Depth from which to do analysis")
-parser.add_argument("-t", "--time", type=float, help="Set minimum move time for evaluation")
-parser.add_argument("-s", "--hash-size", default=1024, type=int, help="Set engine hash size in MB")
-parser.add_argument("-p", "--player-moves", action="store_true", help="Compare each player move to previous player move")
-parser.add_argument("-c", "--computer-moves", action="store_false", help="Compare each player move to best computer move")
-parser.add_argument("-w", "--white-moves", action="store_true", default=False, help="Show only moves from white's perspective")
-parser.add_argument("-b", "--black-moves", action="store_true", default=False, help="Show only moves from black's perspective")
-
-args = vars(parser.parse_args())
-
-# If neither was passed, then we want both to be true. I couldn't find the way
-# to do this in argparse, as defaulting both to True meant if one were passed,
-# the other was still True. Defaulting them to false meant nothing was shown.
-# One scenario meant passing in, say, -w meant that -w was set to False and it
-# showed only Black moves. So I chose to do it this way and be done.
-if not (args['white_moves'] or args['black_moves']):
-  args['white_moves'] = True
-  args['black_moves'] = True
-
-date_str = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
-logging.basicConfig(filename=f"{const.LOG_DIR}/analysis.debug.{date_str}.log", level=logging.DEBUG)
+def setup_logging():
+    if not const.LOG_DIR:
+        const.LOG_DIR = '.'
+    elif not os.path.exists(const.LOG_DIR):
+        try:
+            os.mkdir(const.LOG_DIR)
+        except OSError as error:
+            print(error)
+            os._exit(1)
+
+    date_str = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+    logging.basicConfig(filename=f"{const.LOG_DIR}/analysis.debug.{date_str}.log", level=logging.DEBUG)
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(description="Arg Parse Stuff")
+
+    parser.add_argument("-f", "--file", help="PGN file to parse")
+    parser.add_argument("-e", "--elo", type=int, help="Set engine ELO")
+    parser.add_argument("-d", "--depth", type=int, help="Depth from which to do analysis")
+    parser.add_argument("-t", "--time", type=float, help="Set minimum move time for evaluation")
+    parser.add_argument("-s", "--hash-size", type=int, help="Set engine hash size in MB (default: autotuned, else 1024)")
+    parser.add_argument("-j", "--threads", type=int, help="Set engine Threads (default: autotuned)")
+    parser.add_argument("-P", "--processes", type=int, help="Number of engine processes (default: autotuned, else 1)")
+    parser.add_argument("-o", "--output", help="Append per-ply results as JSON lines to this file (see player_stats.py)")
+    parser.add_argument("-a", "--all-games", action="store_true", help="Analyze every game in the PGN file, not just the first")
+    parser.add_argument("--schedule", choices=("segments", "pool"), default="pool", help="Give each engine single plies as it frees up (default), or contiguous segments of the game (see bench_schedule.py)")
+    parser.add_argument("--order", choices=("backward", "forward"), default="backward", help="Order of the plies inside a segment")
+    parser.add_argument("--hash-policy", choices=("clear", "resize", "keep"), default="clear", help="What to do with the engine hash between games")
+    parser.add_argument("-H", "--prescreen", action="store_true", help="Statically screen for hanging pieces first; search suspect plies deeper and quiet ones shallower")
+    parser.add_argument("--cache-mb", default=const.CACHE_MB, type=int, help="Size of the in-process result cache in MB")
+    early_stop.add_arguments(parser)
+    parser.add_argument("-p", "--player-moves", action="store_true", help="Compare each player move to previous player move")
+    parser.add_argument("-c", "--computer-moves", action="store_false", help="Compare each player move to best computer move")
+    parser.add_argument("-w", "--white-moves", action="store_true", default=False, help="Show only moves from white's perspective")
+    parser.add_argument("-b", "--black-moves", action="store_true", default=False, help="Show only moves from black's perspective")
+
+    args = vars(parser.parse_args(argv))
+
+    # If neither was passed, then we want both to be true. I couldn't find the way
+    # to do this in argparse, as defaulting both to True meant if one were passed,
+    # the other was still True. Defaulting them to false meant nothing was shown.
+    # One scenario meant passing in, say, -w meant that -w was set to False and it
+    # showed only Black moves. So I chose to do it this way and be done.
+    if not (args['white_moves'] or args['black_moves']):
+      args['white_moves'] = True
+      args['black_moves'] = True
+
+    return args
 
 def get_game(pgn):
     return chess.pgn.read_game(open(pgn))
@@ -149,60 +171,93 @@ def evaluate_engine_cp(engine_score, player_score, turn_played):
     else:
         return Category.OK
 
-async def main() -> None:
-    _, engine = await chess.engine.popen_uci('/home/jab3/bin/stockfish')
-    
-    pgn_file = args['file']
-    if not pgn_file:
-        print("Using the test PGN file")
-        pgn_file = "test_game.pgn"
-    
-    if args['depth']:
-        chess.engine.Limit.depth = args['depth']
-    if args['time']:
-        chess.engine.Limit.time = args['time']
-    if args['elo']:
-        elo = args['elo']
-        elo_min = engine.options['UCI_Elo'].min
-        elo_max = engine.options['UCI_Elo'].max
-        if elo < elo_min or elo > elo_max:
-            print(f"Invalid value for ELO, {elo}: must be between {elo_min} and {elo_max}.")
-            os._exit(1)
-        # Set LimitStrength to ensure Elo is actually applied
-        try:
-            await engine.configure({"UCI_LimitStrength": True})
-        except:
-            print("Invalid option UCI_LimitStrength. Available options:")
-            print(engine.options)
-            os._exit(1)
-    
-        try:
-            await engine.configure({"UCI_Elo": elo})
-        except:
-            print("Invalid option, or value, UCI_Elo. Available options:")
-            print(engine.options)
-            os._exit(1)
-    if args['hash_size']:
-        size = args['hash_size']
-        try:
-            await engine.configure({"Hash": size})
-        #    print(f"Hash size: {engine.options['Hash']}")
-        except:
-            print("Invalid option Hash. Available options:")
-            print(engine.options)
-            os._exit(1)
-    
-    # Setting this to greater than 1 seems to affect depth and performance; I
-    # don't know - maybe a VM thing. Leaving it alone seems to work best.
-#    threads = 1
-#    try:
-#        await engine.configure({"Threads": threads})
-#    except:
-#        print("Invalid option, or value, Threads. Available options:")
-#        print(engine.options)
-#        os._exit(1)
-
-    game = get_game(pgn_file)
+async def analyse_board(engine, board, limit=None, criteria=None, stats=None, result_cache=None):
+    if limit is None:
+        limit = chess.engine.Limit
+
+    # The position after a ply's move is the position before the next ply,
+    # so about half of these searches have already been done.
+    if result_cache is not None:
+        info = cache.get_info(result_cache, board, limit)
+        if info is not None:
+            return info
+
+    if criteria:
+        info = await early_stop.analyse_early_stop(engine, board, limit, criteria, stats)
+    else:
+        info = await engine.analyse(board, limit)
+
+    if result_cache is not None:
+        cache.put_info(result_cache, board, limit, info)
+
+    return info
+
+async def analyse_ply(engine, node, board, limit=None, criteria=None, stats=None, result_cache=None):
+    # `board` is the position before node.move
+    move = node.move
+    analysis = await analyse_board(engine, board, limit, criteria, stats, result_cache)
+
+    info = {
+            'analysis': analysis,
+            'player_move': move,
+            'player_san': board.san(move),
+            'best_move': board.san(analysis['pv'][0]),
+            'best_eval': analysis['score'].white(),
+            'player_color': board.turn,
+            'move_num':  board.fullmove_number,
+            'ply': board.ply() + 1,
+            'phase': player_stats.game_phase(board),
+           }
+
+    # It's unfortuate to need to run analysis again. There has to be a way
+    # to avoid this.
+    if move == analysis['pv'][0]:
+        # Player made best move; no need to eval again
+        #info['player_eval'] = analysis['score'].white().score(mate_score=25000)
+        info['player_eval'] = analysis['score'].white()
+    else:
+        board.push(move)
+        analysis = await analyse_board(engine, board, limit, criteria, stats, result_cache)
+
+        #info['player_eval'] = analysis['score'].white().score(mate_score=25000)
+        info['player_eval'] = analysis['score'].white()
+
+        board.pop()
+
+    # May need to format this later (cf. eval_human in annotator)
+    info['player_comment'] = info['player_eval']
+    node.comment = str(info['player_eval'])
+
+    return info
+
+def ply_record(game, gid, ply):
+    # One line of the -o output, which is what player_stats.py ingests.
+    played = ply['player_color']
+    best_eval = ply['best_eval'].score(mate_score=const.MATE_IN_ONE_CP)
+    player_eval = ply['player_eval'].score(mate_score=const.MATE_IN_ONE_CP)
+    cp_loss = best_eval - player_eval if played == chess.WHITE else player_eval - best_eval
+    category = evaluate_engine_cp(ply['best_eval'], ply['player_eval'], played)
+
+    return {
+            'game_id': gid,
+            'white': game.headers['White'],
+            'black': game.headers['Black'],
+            'date': game.headers['Date'],
+            'player': game.headers['White'] if played == chess.WHITE else game.headers['Black'],
+            'color': 'white' if played == chess.WHITE else 'black',
+            'ply': ply['ply'],
+            'move_num': ply['move_num'],
+            'phase': ply['phase'],
+            'san': ply['player_san'],
+            'best': ply['best_move'],
+            'player_eval': player_eval,
+            'best_eval': best_eval,
+            'cp_loss': max(cp_loss, 0),
+            'category': category.name,
+            'depth': ply['analysis']['depth'],
+           }
+
+async def analyze_game(args, engines, game, early_stop_criteria=None, early_stop_stats=None, result_cache=None):
     #board_complete = Complete_Board(game)
 
     game_white = game.headers['White']
@@ -211,54 +266,46 @@ async def main() -> None:
 
     print(f"Analyzing game between {game_white} and {game_black} on {game_date}")
 
-    game_analysis = []
-    node = game.end()
-    while not node == game.root():
-        prev_node = node.parent
-        board = prev_node.board()
-        move = node.move
-        analysis = await engine.analyse(board, chess.engine.Limit)
-
-        info = {
-                'analysis': analysis,
-                'player_move': move,
-                'player_san': board.san(move),
-                'best_move': board.san(analysis['pv'][0]),
-                'best_eval': analysis['score'].white(),
-                'player_color': board.turn,
-                'move_num':  board.fullmove_number,
-               }
-
-        # It's unfortuate to need to run analysis again. There has to be a way
-        # to avoid this.
-        if move == analysis['pv'][0]:
-            # Player made best move; no need to eval again
-            #info['player_eval'] = analysis['score'].white().score(mate_score=25000)
-            info['player_eval'] = analysis['score'].white()
-        else:
-            board.push(move)
-            analysis = await engine.analyse(board, chess.engine.Limit)
-
-            #info['player_eval'] = analysis['score'].white().score(mate_score=25000)
-            info['player_eval'] = analysis['score'].white()
-
-            board.pop()
-
-        # May need to format this later (cf. eval_human in annotator)
-        info['player_comment'] = info['player_eval']
-        node.comment = str(info['player_eval'])
+    # With --prescreen, plies that statically leave material hanging get a
+    # bigger search budget and quiet ones a smaller one.
+    flags = None
+    if args['prescreen']:
+        flags = prescreen.prescreen_game(game)
+        suspect = sum(flag['suspect'] for flag in flags)
+        quiet = sum(flag['quiet'] for flag in flags)
+        logging.info(f"Prescreen: {suspect} suspect, {quiet} quiet of {len(flags)} plies")
+
+    # Each ply paired with the position before it, built in one pass rather
+    # than node.board() replaying the game from the start for every ply.
+    plies = []
+    board = game.board()
+    for i, node in enumerate(game.mainline()):
+        limit = None
+        if flags:
+            limit = prescreen.search_limit(flags[i], chess.engine.Limit.depth, chess.engine.Limit.time)
+        plies.append((node, board.copy(), limit))
+        board.push(node.move)
+
+    worker = lambda engine, ply: analyse_ply(engine, *ply, early_stop_criteria, early_stop_stats, result_cache)
+    if args['schedule'] == 'pool':
+        # Plies handed out one at a time, last to first, to whichever engine
+        # is free
+        game_analysis = list(reversed(await engine_pool.run_pool(engines, list(reversed(plies)), worker)))
+    else:
+        game_analysis = await scheduler.run_segments(engines, plies, worker, args['order'])
 
-        game_analysis.append(info)
-        node = prev_node
+    if flags:
+        for ply, flag in zip(game_analysis, flags):
+            ply['prescreen'] = flag
 
-#    for ply in reversed(game_analysis):
+#    for ply in game_analysis:
 #        print(f"{ply['player_san']}:")
 #        print(f"\tPlayer eval: {ply['player_eval']}")
 #        print(f"\tBest move: {ply['best_move']}")
 #        print(f"\tBest move score: {ply['best_eval']}")
 
     prev_ply = None
-    for ply in reversed(game_analysis):
+    for ply in game_analysis:
         san = ply['player_san']
         best_san = ply['best_move']
         move_num = ply['move_num']
@@ -268,6 +315,10 @@ async def main() -> None:
         depth = ply['analysis']['depth']
         prev_score = prev_ply['player_eval'] if prev_ply else chess.engine.Cp(0)
 
+        if ply.get('prescreen') and ply['prescreen']['suspect']:
+            if (args['white_moves'] and played == chess.WHITE) or (args['black_moves'] and played == chess.BLACK):
+                print(prescreen.alert(ply['prescreen']))
+
         if args['player_moves']:
             player_cp_category = evaluate_player_cp(ply, prev_ply, played)
             if (args['white_moves'] and played == chess.WHITE) or (args['black_moves'] and played == chess.BLACK):
@@ -304,7 +355,93 @@ async def main() -> None:
 
         prev_ply = ply
 
-    await engine.quit()
+    if args['output']:
+        gid = player_stats.game_id(game)
+        with open(args['output'], 'a') as out:
+            for ply in game_analysis:
+                out.write(json.dumps(ply_record(game, gid, ply)) + '\n')
+
+async def analyze_games(args):
+    import chess.pgn
+    import chess.engine
+
+    setup_logging()
+
+    early_stop_criteria = early_stop.criteria_from_args(args)
+    early_stop_stats = early_stop.Early_Stop_Stats()
+
+    result_cache = cache.LRU_Cache(args['cache_mb'] * 1024 * 1024)
+
+    # Processes/Threads/Hash default to whatever autotune.py found fastest on
+    # this host.
+    processes, options = autotune.engine_settings(args['processes'], args['threads'], args['hash_size'])
+    hash_size = options["Hash"]
+
+    engines = await engine_pool.open_engines(conf.DEFAULT_STOCKFISH_BIN, processes, options)
+    
+    pgn_file = args['file']
+    if not pgn_file:
+        print("Using the test PGN file")
+        pgn_file = "test_game.pgn"
+    
+    if args['depth']:
+        chess.engine.Limit.depth = args['depth']
+    if args['time']:
+        chess.engine.Limit.time = args['time']
+    if args['elo']:
+        elo = args['elo']
+        elo_min = engines[0].options['UCI_Elo'].min
+        elo_max = engines[0].options['UCI_Elo'].max
+        if elo < elo_min or elo > elo_max:
+            print(f"Invalid value for ELO, {elo}: must be between {elo_min} and {elo_max}.")
+            os._exit(1)
+        for engine in engines:
+            # Set LimitStrength to ensure Elo is actually applied
+            try:
+                await engine.configure({"UCI_LimitStrength": True})
+            except:
+                print("Invalid option UCI_LimitStrength. Available options:")
+                print(engine.options)
+                os._exit(1)
+    
+            try:
+                await engine.configure({"UCI_Elo": elo})
+            except:
+                print("Invalid option, or value, UCI_Elo. Available options:")
+                print(engine.options)
+                os._exit(1)
+
+    logging.info(f"Engines: processes={len(engines)}, options={options}")
+
+    hash_policy = args['hash_policy']
+    games = 0
+    with open(pgn_file) as pgn:
+        while game := chess.pgn.read_game(pgn):
+            plies = sum(1 for _ in game.mainline_moves())
+            if games or hash_policy == 'resize':
+                await scheduler.reset_hash(engines, hash_policy, scheduler.hash_for_game(plies, hash_size))
+
+            await analyze_game(args, engines, game, early_stop_criteria, early_stop_stats, result_cache)
+            games += 1
+
+            if not args['all_games']:
+                break
+
+    if early_stop_criteria:
+        logging.info(f"Early stop criteria: {early_stop_criteria}")
+        early_stop_stats.log()
+    logging.info(result_cache.summary())
+
+    await engine_pool.close_engines(engines)
+
+def main(argv=None) -> None:
+    args = parse_arguments(argv)
+
+    import asyncio
+    import chess.engine
+
+    asyncio.set_event_loop_policy(chess.engine.EventLoopPolicy())
+    asyncio.run(analyze_games(args))
 
-asyncio.set_event_loop_policy(chess.engine.EventLoopPolicy())
-asyncio.run(main())
+if __name__ == "__main__":
+    main()
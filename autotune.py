@@ -0,0 +1,171 @@
+#!/usr/bin/env python3.11
+
+# Figure out which combination of engine processes, Threads and Hash gives the
+# most plies/sec on this machine, rather than guessing. A fixed set of
+# positions from the PGN is analyzed to a fixed depth for each combination
+# (several times, keeping the median, since one run is noisy) and the fastest
+# one is written to config.AUTOTUNE_FILE, which the analysis scripts pick up
+# as their defaults. The fastest single-process combination is written too,
+# for run_analysis.py, which only ever runs one engine.
+
+import os
+import json
+import time
+import platform
+import argparse
+import itertools
+import statistics
+
+import asyncio
+
+import chess
+import chess.pgn
+import chess.engine
+
+import config as conf
+import engine_pool
+
+def load_tuned_config(path=conf.AUTOTUNE_FILE, single_process=False):
+    # Returns the best configuration from a previous autotune run, or None if
+    # there hasn't been one (or it can't be read), in which case callers fall
+    # back to their own defaults. With single_process, the best configuration
+    # using one engine process.
+    try:
+        with open(path) as f:
+            tuned = json.load(f)
+        return tuned['best_single'] if single_process else tuned['best']
+    except (OSError, ValueError, KeyError):
+        return None
+
+def engine_settings(processes=None, threads=None, hash_size=None, default_hash=1024):
+    # (processes, engine options) for the asyncio scripts: whatever was given
+    # on the command line, else the last autotune run, else 1 process and
+    # `default_hash`. Without an autotune run Threads is left alone: setting
+    # it to greater than 1 seemed to affect depth and performance (maybe a VM
+    # thing).
+    tuned = load_tuned_config() or {}
+    processes = processes or tuned.get('processes', 1)
+    threads = threads or tuned.get('threads')
+
+    options = {"Hash": hash_size or tuned.get('hash', default_hash)}
+    if threads:
+        options["Threads"] = threads
+
+    return processes, options
+
+def sample_positions(pgn_file, stride=4):
+    # Every `stride` plies of the first game in the file. Skips positions with
+    # no legal moves since there's nothing to search.
+    with open(pgn_file) as pgn:
+        game = chess.pgn.read_game(pgn)
+
+    positions = []
+    board = game.board()
+    for ply, move in enumerate(game.mainline_moves()):
+        if ply % stride == 0 and not board.is_game_over():
+            positions.append(board.copy(stack=False))
+        board.push(move)
+
+    return positions
+
+def parse_int_list(s):
+    return [int(x) for x in s.split(',') if x.strip()]
+
+async def measure_once(binary, positions, depth, processes, threads, hash_size):
+    # Fresh engines every time so an earlier run's hash doesn't help this one
+    engines = await engine_pool.open_engines(binary, processes, {"Threads": threads, "Hash": hash_size})
+    limit = chess.engine.Limit(depth=depth)
+
+    async def worker(engine, board):
+        return await engine.analyse(board, limit)
+
+    start = time.perf_counter()
+    infos = await engine_pool.run_pool(engines, positions, worker)
+    elapsed = time.perf_counter() - start
+
+    await engine_pool.close_engines(engines)
+
+    nodes = sum(info.get('nodes', 0) for info in infos)
+
+    return elapsed, nodes
+
+async def measure(binary, positions, depth, processes, threads, hash_size, repeat=3):
+    # Median of `repeat` runs; a single run can be off by 20% or more just
+    # from whatever else the machine is doing.
+    samples = [await measure_once(binary, positions, depth, processes, threads, hash_size) for _ in range(repeat)]
+    elapsed = statistics.median(seconds for seconds, _ in samples)
+    nodes = statistics.median(nodes for _, nodes in samples)
+
+    return {
+            'processes': processes,
+            'threads': threads,
+            'hash': hash_size,
+            'seconds': round(elapsed, 3),
+            'plies_per_sec': round(len(positions) / elapsed, 3),
+            'nps': int(nodes / elapsed),
+            'samples': [round(seconds, 3) for seconds, _ in samples],
+           }
+
+async def autotune(args):
+    positions = sample_positions(args['file'], args['stride'])
+    cpus = os.cpu_count() or 1
+
+    print(f"Tuning on {len(positions)} positions from {args['file']} at depth {args['depth']} ({cpus} CPUs)")
+
+    results = []
+    for processes, threads, hash_size in itertools.product(args['processes'], args['threads'], args['hash']):
+        # Oversubscribing the CPUs or memory only ever makes things worse, so
+        # don't bother measuring it.
+        if processes * threads > cpus:
+            continue
+        if processes * hash_size > args['max_hash']:
+            continue
+
+        result = await measure(args['binary'], positions, args['depth'], processes, threads, hash_size, args['repeat'])
+        print(f"processes={processes} threads={threads} hash={hash_size}: "
+              f"{result['plies_per_sec']} plies/sec, {result['nps']} nps (median {result['seconds']}s of {result['samples']})")
+        results.append(result)
+
+    if not results:
+        print("No combination fits on this host; check --processes, --threads and --max-hash.")
+        os._exit(1)
+
+    best = max(results, key=lambda r: r['plies_per_sec'])
+    single = [r for r in results if r['processes'] == 1]
+    best_single = max(single, key=lambda r: r['plies_per_sec']) if single else None
+
+    with open(args['output'], 'w') as f:
+        json.dump({
+                   'host': platform.node(),
+                   'cpus': cpus,
+                   'depth': args['depth'],
+                   'positions': len(positions),
+                   'repeat': args['repeat'],
+                   'best': best,
+                   'best_single': best_single,
+                   'results': results,
+                  }, f, indent=2)
+
+    print(f"Best: processes={best['processes']} threads={best['threads']} hash={best['hash']} "
+          f"({best['plies_per_sec']} plies/sec); written to {args['output']}")
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Find the fastest engine processes/Threads/Hash combination for this host")
+    parser.add_argument("-f", "--file", default="test_game.pgn", help="PGN file to take positions from")
+    parser.add_argument("-d", "--depth", default=18, type=int, help="Depth to analyze each position to")
+    parser.add_argument("-n", "--stride", default=4, type=int, help="Use every Nth ply of the game")
+    parser.add_argument("-P", "--processes", default=[1, 2, 4], type=parse_int_list, help="Comma separated engine process counts to try")
+    parser.add_argument("-T", "--threads", default=[1, 2, 4, 6], type=parse_int_list, help="Comma separated Threads values to try")
+    parser.add_argument("-H", "--hash", default=[256, 1024, 2048], type=parse_int_list, help="Comma separated Hash sizes (MB) to try")
+    parser.add_argument("-r", "--repeat", default=3, type=int, help="Times to measure each combination (the median is used)")
+    parser.add_argument("-m", "--max-hash", default=4096, type=int, help="Maximum total Hash (MB) across all processes")
+    parser.add_argument("-o", "--output", default=conf.AUTOTUNE_FILE, help="Where to write the results")
+    parser.add_argument("--binary", default=conf.DEFAULT_STOCKFISH_BIN, help="Engine binary")
+
+    args = vars(parser.parse_args())
+
+    asyncio.set_event_loop_policy(chess.engine.EventLoopPolicy())
+    asyncio.run(autotune(args))
+
+if __name__ == "__main__":
+    main()
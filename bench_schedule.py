@@ -0,0 +1,90 @@
+#!/usr/bin/env python3.11
+
+# Nodes needed to reach a fixed depth for every ply of a game under each way
+# of handing plies to engines:
+#
+#   pool              plies handed out one at a time, last to first, to
+#                     whichever engine is free (async_analysis.py's default)
+#   segments/backward contiguous segments per engine, last ply first
+#   segments/forward  contiguous segments per engine, first ply first
+#
+# Each ply is searched the way async_analysis.py does it: the position before
+# the move, then the position after it. Every run starts from freshly started
+# engines so one run's hash doesn't help the next. Fewer nodes to the same
+# depth is hash reuse paying off. This needs a real engine: one without a
+# hash table reports the same nodes for every schedule.
+
+import time
+import argparse
+
+import asyncio
+
+import chess
+import chess.pgn
+import chess.engine
+
+import config as conf
+import engine_pool
+import scheduler
+
+async def run(args, schedule, order):
+    with open(args['file']) as pgn:
+        game = chess.pgn.read_game(pgn)
+
+    plies = []
+    board = game.board()
+    for node in game.mainline():
+        plies.append((node, board.copy()))
+        board.push(node.move)
+
+    limit = chess.engine.Limit(depth=args['depth'])
+
+    async def worker(engine, ply):
+        node, board = ply
+        board = board.copy()
+        nodes = (await engine.analyse(board, limit)).get('nodes', 0)
+        board.push(node.move)
+        nodes += (await engine.analyse(board, limit)).get('nodes', 0)
+        return nodes
+
+    engines = await engine_pool.open_engines(args['binary'], args['processes'],
+                                             {"Hash": args['hash_size'], "Threads": args['threads']})
+
+    start = time.perf_counter()
+    if schedule == 'pool':
+        nodes = await engine_pool.run_pool(engines, list(reversed(plies)), worker)
+    else:
+        nodes = await scheduler.run_segments(engines, plies, worker, order)
+    elapsed = time.perf_counter() - start
+
+    await engine_pool.close_engines(engines)
+
+    return sum(nodes), elapsed
+
+async def bench(args):
+    print(f"{args['file']}: depth {args['depth']}, {args['processes']} engines x {args['threads']} threads, "
+          f"Hash {args['hash_size']} MB")
+    print(f"{'schedule':<20} {'nodes':>14} {'vs pool':>8} {'seconds':>8}")
+
+    base = None
+    for schedule, order in (('pool', None), ('segments', 'backward'), ('segments', 'forward')):
+        nodes, elapsed = await run(args, schedule, order)
+        base = base or nodes
+        name = schedule if not order else f"{schedule}/{order}"
+        print(f"{name:<20} {nodes:>14} {nodes / base:>8.2f} {elapsed:>8.1f}")
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compare nodes-to-depth for the ways of scheduling plies on engines")
+    parser.add_argument("-f", "--file", default="test_game.pgn", help="PGN file (first game is used)")
+    parser.add_argument("-d", "--depth", default=16, type=int, help="Depth to analyze each position to")
+    parser.add_argument("-P", "--processes", default=2, type=int, help="Number of engine processes")
+    parser.add_argument("-j", "--threads", default=1, type=int, help="Threads per engine")
+    parser.add_argument("-s", "--hash-size", default=256, type=int, help="Hash per engine in MB")
+    parser.add_argument("--binary", default=conf.DEFAULT_STOCKFISH_BIN, help="Engine binary")
+    args = vars(parser.parse_args())
+
+    asyncio.set_event_loop_policy(chess.engine.EventLoopPolicy())
+    asyncio.run(bench(args))
+
+if __name__ == "__main__":
+    main()
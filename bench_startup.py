@@ -0,0 +1,43 @@
+#!/usr/bin/env python3.11
+
+# Startup/import time of the command line scripts. Each case is run in a
+# fresh interpreter a number of times and the median and best wall-clock times
+# are reported, along with a bare `python -c pass` for reference since that's
+# the floor for everything else.
+
+import sys
+import time
+import argparse
+import statistics
+import subprocess
+
+CASES = [
+         ('python -c pass', ['-c', 'pass']),
+         ('import run_analysis', ['-c', 'import run_analysis']),
+         ('import async_analysis', ['-c', 'import async_analysis']),
+         ('run_analysis.py --help', ['run_analysis.py', '--help']),
+         ('async_analysis.py --help', ['async_analysis.py', '--help']),
+         ('run_analysis.py --list', ['run_analysis.py', '--list']),
+         ('run_analysis.py --print-fen', ['run_analysis.py', '--print-fen']),
+        ]
+
+def time_case(argv, runs):
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable] + argv, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+        times.append((time.perf_counter() - start) * 1000)
+    return statistics.median(times), min(times)
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Startup time of the command line scripts")
+    parser.add_argument("-n", "--runs", default=10, type=int, help="Runs per case")
+    args = vars(parser.parse_args())
+
+    print(f"{'case':<32} {'median ms':>10} {'best ms':>10}")
+    for name, argv in CASES:
+        median, best = time_case(argv, args['runs'])
+        print(f"{name:<32} {median:>10.1f} {best:>10.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3.11
+
+# In-process LRU cache for engine results (InfoDicts) that get asked for over
+# and over within a run. Entries are keyed by the position's Zobrist hash
+# (chess.polyglot) plus the halfmove clock, and the cache is capped in bytes
+# rather than entries so it can be sized for big batch runs. Hit/miss counts
+# are kept per kind of entry so the hit rate can be checked (see summary()).
+#
+# One result is kept per position, along with the limit it was searched
+# with; it answers any request it covers, so a depth 20 result is good for a
+# depth 16 request too (see limit_covers()). Zobrist hashes don't include the
+# repetition history, and the engine sees the whole move stack, so a
+# position that has already occurred in the game is never looked up or
+# stored: its score may be a draw by repetition where the first occurrence's
+# wasn't.
+
+import sys
+from collections import OrderedDict
+
+import chess
+import chess.polyglot
+
+import constants as const
+
+def approx_size(obj, seen=None):
+    # Rough deep size in bytes; good enough to keep the cache near its cap.
+    if seen is None:
+        seen = set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(approx_size(k, seen) + approx_size(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(approx_size(item, seen) for item in obj)
+    elif hasattr(obj, '__dict__'):
+        size += approx_size(vars(obj), seen)
+    elif hasattr(obj, '__slots__'):
+        size += sum(approx_size(getattr(obj, slot), seen) for slot in obj.__slots__ if hasattr(obj, slot))
+
+    return size
+
+class LRU_Cache:
+    def __init__(self, max_bytes=const.CACHE_MB * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.entries = OrderedDict()
+        # kind -> [hits, misses]; kind is the first element of the key
+        self.counts = {}
+        self.evictions = 0
+
+    def get(self, key, accept=None):
+        # `accept`, if given, is called with the cached value; a value it
+        # rejects counts as a miss.
+        counts = self.counts.setdefault(key[0], [0, 0])
+        entry = self.entries.get(key)
+        if entry is None or (accept and not accept(entry[0])):
+            counts[1] += 1
+            return None
+        counts[0] += 1
+        self.entries.move_to_end(key)
+        return entry[0]
+
+    def peek(self, key):
+        # No counting and no LRU update
+        entry = self.entries.get(key)
+        return entry[0] if entry else None
+
+    def put(self, key, value):
+        size = approx_size(key) + approx_size(value)
+        if size > self.max_bytes:
+            return
+        old = self.entries.pop(key, None)
+        if old is not None:
+            self.bytes -= old[1]
+        self.entries[key] = (value, size)
+        self.bytes += size
+        while self.bytes > self.max_bytes:
+            _, (_, evicted) = self.entries.popitem(last=False)
+            self.bytes -= evicted
+            self.evictions += 1
+
+    def stats(self):
+        kinds = {}
+        for kind, (hits, misses) in self.counts.items():
+            lookups = hits + misses
+            kinds[kind] = {'hits': hits, 'misses': misses, 'hit_rate': hits / lookups if lookups else 0.0}
+        return {
+                'entries': len(self.entries),
+                'bytes': self.bytes,
+                'max_bytes': self.max_bytes,
+                'evictions': self.evictions,
+                'kinds': kinds,
+               }
+
+    def summary(self):
+        stats = self.stats()
+        kinds = '; '.join(f"{kind}: {s['hits']}/{s['hits'] + s['misses']} hits ({100 * s['hit_rate']:.1f}%)"
+                          for kind, s in sorted(stats['kinds'].items()))
+        return (f"Cache: {stats['entries']} entries, {stats['bytes'] / 1024 / 1024:.1f}/"
+                f"{stats['max_bytes'] / 1024 / 1024:.0f} MB, {stats['evictions']} evictions; {kinds or 'no lookups'}")
+
+def position_key(board):
+    return chess.polyglot.zobrist_hash(board)
+
+def limit_key(limit):
+    # Works for a chess.engine.Limit instance or the class itself (which
+    # run_analysis.py/async_analysis.py configure through class attributes).
+    return tuple(getattr(limit, name, None) for name in ('depth', 'time', 'nodes', 'mate'))
+
+def limit_covers(have, want):
+    # Whether a search with limit `have` went at least as far as one with
+    # `want` would (both from limit_key()). None is no limit at all.
+    *have_bounds, have_mate = have
+    *want_bounds, want_mate = want
+    if have_mate != want_mate:
+        return False
+    for h, w in zip(have_bounds, want_bounds):
+        if h is not None and (w is None or h < w):
+            return False
+    return True
+
+def info_key(board):
+    # None if the position can't be cached (see above)
+    if board.is_repetition(2):
+        return None
+    return ('info', position_key(board), board.halfmove_clock)
+
+def get_info(cache, board, limit):
+    key = info_key(board)
+    if key is None:
+        return None
+    want = limit_key(limit)
+    entry = cache.get(key, lambda entry: limit_covers(entry[0], want))
+    return entry[1] if entry else None
+
+def put_info(cache, board, limit, info):
+    key = info_key(board)
+    if key is None:
+        return
+    have = limit_key(limit)
+    # Don't replace a deeper result with a shallower one
+    old = cache.peek(key)
+    if old is not None and limit_covers(old[0], have) and not limit_covers(have, old[0]):
+        return
+    cache.put(key, (have, info))
@@ -1 +1,3 @@
 DEFAULT_STOCKFISH_BIN='/usr/bin/stockfish'
+AUTOTUNE_FILE='autotune.json'
+PLAYER_STATS_FILE='player_stats.json'
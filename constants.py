@@ -10,6 +10,19 @@ CP_INACCURACY = 40
 CP_MISTAKE    = 90
 CP_BLUNDER    = 200
 
+# Per-ply centipawn loss is capped at this when averaging (ACPL) so a single
+# missed mate doesn't swamp a player's numbers
+ACPL_CAP_CP = 1000
+
+# Game phases: the opening is the first PHASE_OPENING_MOVES moves, the endgame
+# is once the non-pawn material on the board (both sides, in pawns, using
+# PIECE_VALUES) is at or below PHASE_ENDGAME_MATERIAL. The middlegame is the
+# rest.
+PHASE_OPENING_MOVES    = 12
+PHASE_ENDGAME_MATERIAL = 26
+
+PIECE_VALUES = {1: 1, 2: 3, 3: 3, 4: 5, 5: 9, 6: 0}  # chess.PAWN .. chess.KING
+
 # Totally arbitrary
 MATE_IN_ONE_CP = 25000
 MATE_CP_SCALE  = 1000
@@ -22,3 +35,29 @@ class Category(Enum):
     MISTAKE    = 0x04
     BLUNDER    = 0x08
     MATE       = 0x10
+
+# Early termination of a search: stop once the score has stayed within
+# EARLY_STOP_TOLERANCE_CP and the best move hasn't changed for
+# EARLY_STOP_STABLE_DEPTHS consecutive depths, but never before
+# EARLY_STOP_MIN_DEPTH.
+EARLY_STOP_TOLERANCE_CP  = 15
+EARLY_STOP_STABLE_DEPTHS = 4
+EARLY_STOP_MIN_DEPTH     = 10
+
+# With the 'resize' hash policy the engine hash is sized to the game about to
+# be analyzed: this many MB per ply, rounded up to a power of two and capped
+# at the configured Hash
+HASH_MB_PER_PLY = 8
+
+# Static (engine-free) pre-screen for hanging material, see prescreen.py.
+# Plies that leave material en prise are searched PRESCREEN_DEPTH_BOOST deeper
+# (or PRESCREEN_TIME_SCALE times longer); quiet plies PRESCREEN_DEPTH_CUT
+# shallower (or that much less time), but never below PRESCREEN_MIN_DEPTH
+# (or the base depth, if that's already lower).
+PRESCREEN_DEPTH_BOOST = 4
+PRESCREEN_DEPTH_CUT   = 4
+PRESCREEN_MIN_DEPTH   = 8
+PRESCREEN_TIME_SCALE  = 2.0
+
+# Default size of the in-process result cache (cache.py)
+CACHE_MB = 64
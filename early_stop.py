@@ -0,0 +1,154 @@
+#!/usr/bin/env python3.11
+
+# Stop a search early instead of always waiting for the full depth/time limit.
+# The engine's info lines are streamed (engine.analysis() rather than
+# engine.analyse()) and the search is stopped once the score and best move
+# have settled for a few depths in a row, or once a mate has been found.
+
+import logging
+
+import constants as const
+
+class Stop_Criteria:
+    def __init__(self, tolerance_cp=const.EARLY_STOP_TOLERANCE_CP,
+                 stable_depths=const.EARLY_STOP_STABLE_DEPTHS,
+                 min_depth=const.EARLY_STOP_MIN_DEPTH,
+                 stop_on_mate=True):
+        self.tolerance_cp = tolerance_cp
+        self.stable_depths = stable_depths
+        self.min_depth = min_depth
+        self.stop_on_mate = stop_on_mate
+
+    def __repr__(self):
+        return (f"Stop_Criteria(tolerance_cp={self.tolerance_cp}, stable_depths={self.stable_depths}, "
+                f"min_depth={self.min_depth}, stop_on_mate={self.stop_on_mate})")
+
+def is_complete_info(info):
+    # Only lines that finish an iteration are worth looking at: they have a
+    # score and PV, and the score isn't just a bound from a failed aspiration
+    # window.
+    return ('depth' in info and 'score' in info and info.get('pv')
+            and not info.get('lowerbound') and not info.get('upperbound'))
+
+def add_arguments(parser):
+    # The early stop options, shared by the analysis scripts
+    parser.add_argument("-x", "--early-stop", action="store_true", help="Stop a search early once the score/best move are stable or a mate is found")
+    parser.add_argument("--stop-tolerance", default=const.EARLY_STOP_TOLERANCE_CP, type=int, help="Early stop: max score change (cp) between depths to count as stable")
+    parser.add_argument("--stop-depths", default=const.EARLY_STOP_STABLE_DEPTHS, type=int, help="Early stop: number of consecutive stable depths required")
+    parser.add_argument("--stop-min-depth", default=const.EARLY_STOP_MIN_DEPTH, type=int, help="Early stop: never stop before this depth")
+    parser.add_argument("--no-stop-on-mate", dest="stop_on_mate", action="store_false", help="Early stop: don't stop just because a mate was found")
+
+def criteria_from_args(args):
+    # Stop_Criteria from the parsed options (as a dict), or None without -x
+    if not args['early_stop']:
+        return None
+    return Stop_Criteria(args['stop_tolerance'], args['stop_depths'], args['stop_min_depth'], args['stop_on_mate'])
+
+class Early_Stop_Tracker:
+    def __init__(self, criteria):
+        self.criteria = criteria
+        self.depth = 0
+        self.score = None
+        self.move = None
+        self.run = 0
+        # (move, score, run) as of the end of the previous depth
+        self.prev = (None, None, 0)
+
+    def update(self, info):
+        # Feed a complete info line; returns the reason to stop ('mate' or
+        # 'stable'), or None to keep searching.
+        depth = info['depth']
+        score = info['score'].relative
+        move = info['pv'][0]
+
+        if self.criteria.stop_on_mate and score.is_mate():
+            return 'mate'
+
+        cp = score.score(mate_score=const.MATE_IN_ONE_CP)
+
+        if depth != self.depth:
+            self.prev = (self.move, self.score, self.run)
+
+        # The same depth reported again (e.g. after a re-search) replaces the
+        # previous line, so either way it's compared against the previous
+        # depth rather than counting as a new one.
+        prev_move, prev_score, prev_run = self.prev
+        if prev_move == move and abs(cp - prev_score) <= self.criteria.tolerance_cp:
+            self.run = prev_run + 1
+        else:
+            self.run = 1
+
+        self.depth = depth
+        self.score = cp
+        self.move = move
+
+        if depth >= self.criteria.min_depth and self.run >= self.criteria.stable_depths:
+            return 'stable'
+
+        return None
+
+class Early_Stop_Stats:
+    def __init__(self):
+        self.searches = 0
+        self.stopped = {'stable': 0, 'mate': 0}
+        self.depths = {}
+
+    def record(self, reason, depth, board=None):
+        self.searches += 1
+        if not reason:
+            return
+        self.stopped[reason] += 1
+        self.depths[depth] = self.depths.get(depth, 0) + 1
+        fen = f": {board.fen()}" if board else ''
+        logging.debug(f"Early stop ({reason}) at depth {depth}{fen}")
+
+    def summary(self):
+        stopped = sum(self.stopped.values())
+        pct = 100 * stopped / self.searches if self.searches else 0
+        depths = ', '.join(f"{d}:{n}" for d, n in sorted(self.depths.items()))
+        return (f"Early stop: {stopped}/{self.searches} searches ({pct:.1f}%) stopped early "
+                f"(stable: {self.stopped['stable']}, mate: {self.stopped['mate']}); "
+                f"by depth: {depths or 'none'}")
+
+    def log(self):
+        logging.info(self.summary())
+
+async def analyse_early_stop(engine, board, limit, criteria, stats=None):
+    # Drop-in for `await engine.analyse(board, limit)`.
+    tracker = Early_Stop_Tracker(criteria)
+    reason = None
+    with await engine.analysis(board, limit) as analysis:
+        async for info in analysis:
+            if not is_complete_info(info):
+                continue
+            reason = tracker.update(info)
+            if reason:
+                result = info
+                break
+        else:
+            result = analysis.info
+
+    if stats is not None:
+        stats.record(reason, result.get('depth'), board)
+
+    return result
+
+def analyse_early_stop_sync(engine, board, limit, criteria, stats=None):
+    # Same as above for chess.engine.SimpleEngine.
+    tracker = Early_Stop_Tracker(criteria)
+    reason = None
+    with engine.analysis(board, limit) as analysis:
+        for info in analysis:
+            if not is_complete_info(info):
+                continue
+            reason = tracker.update(info)
+            if reason:
+                result = info
+                break
+        else:
+            result = analysis.info
+
+    if stats is not None:
+        stats.record(reason, result.get('depth'), board)
+
+    return result
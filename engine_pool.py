@@ -0,0 +1,58 @@
+#!/usr/bin/env python3.11
+
+# A small pool of UCI engine processes for the asyncio side of things. Each
+# engine gets the same options (Threads, Hash, ...) and work is handed out to
+# whichever engine is free next.
+
+import os
+import asyncio
+
+import chess
+import chess.engine
+
+async def open_engines(binary, processes=1, options=None):
+    engines = []
+    for _ in range(max(1, int(processes))):
+        _, engine = await chess.engine.popen_uci(binary)
+        if options:
+            try:
+                await engine.configure(options)
+            except chess.engine.EngineError as error:
+                print(f"Invalid engine option in {options}: {error}")
+                print(engine.options)
+                for e in engines + [engine]:
+                    await e.quit()
+                os._exit(1)
+        engines.append(engine)
+
+    return engines
+
+async def close_engines(engines):
+    for engine in engines:
+        try:
+            await engine.quit()
+        except chess.engine.EngineTerminatedError:
+            # Already gone
+            pass
+
+async def run_pool(engines, items, worker):
+    # Run `worker(engine, item)` for every item, with each engine pulling the
+    # next item off a shared queue as soon as it's done with the last one.
+    # Results come back in the same order as `items`.
+    queue = asyncio.Queue()
+    for i, item in enumerate(items):
+        queue.put_nowait((i, item))
+
+    results = [None] * queue.qsize()
+
+    async def consume(engine):
+        while True:
+            try:
+                i, item = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            results[i] = await worker(engine, item)
+
+    await asyncio.gather(*(consume(engine) for engine in engines))
+
+    return results
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3.11
+
+# Analyze a stream of positions, one FEN per line, from a file or stdin, and
+# write one JSON line per position as soon as its analysis finishes (so the
+# output order is not necessarily the input order; each line carries the
+# input line number). Meant for bulk jobs like puzzle/training-set
+# generation: the positions are spread over a pool of engines, and positions
+# seen before (or currently being analyzed) are answered from the cache
+# (cache.py) rather than searched again.
+
+import sys
+import json
+import argparse
+
+import constants as const
+import config as conf
+import early_stop
+from lazy import lazy_import
+
+chess = lazy_import('chess')
+autotune = lazy_import('autotune')
+engine_pool = lazy_import('engine_pool')
+cache = lazy_import('cache')
+
+def result_line(n, fen, board, info, cached):
+    score = info['score'].relative if 'score' in info else None
+    pv = info.get('pv', [])
+
+    return {
+            'line': n,
+            'fen': fen,
+            # From the side to move's point of view
+            'score': score.score() if score is not None and not score.is_mate() else None,
+            'mate': score.mate() if score is not None and score.is_mate() else None,
+            'best': pv[0].uci() if pv else None,
+            'best_san': board.san(pv[0]) if pv else None,
+            'pv': [move.uci() for move in pv],
+            'depth': info.get('depth'),
+            'cached': cached,
+           }
+
+async def analyze_fens(args):
+    import asyncio
+    import chess.engine
+
+    processes, options = autotune.engine_settings(args['processes'], args['threads'], args['hash_size'])
+
+    limit = chess.engine.Limit(depth=args['depth'], time=args['time'])
+
+    criteria = early_stop.criteria_from_args(args)
+    stats = early_stop.Early_Stop_Stats()
+
+    # Finished results (see cache.py), plus the positions being searched
+    # right now so a duplicate that turns up meanwhile just waits for that
+    # search.
+    result_cache = cache.LRU_Cache(args['cache_mb'] * 1024 * 1024)
+    pending = {}
+    waits = 0
+    # Bounded so a huge input is read as fast as the engines can keep up with,
+    # not all at once.
+    queue = asyncio.Queue(maxsize=processes * 4)
+
+    infile = sys.stdin if args['input'] == '-' else open(args['input'])
+    out = sys.stdout if args['output'] == '-' else open(args['output'], 'w')
+
+    def emit(record):
+        out.write(json.dumps(record) + '\n')
+        out.flush()
+
+    async def produce():
+        n = 0
+        while True:
+            # readline() blocks, so keep it off the event loop
+            line = await asyncio.to_thread(infile.readline)
+            if not line:
+                break
+            n += 1
+            fen = line.strip()
+            if fen:
+                await queue.put((n, fen))
+        for _ in range(processes):
+            await queue.put(None)
+
+    async def consume(i):
+        nonlocal waits
+        while True:
+            item = await queue.get()
+            if item is None:
+                return
+            n, fen = item
+
+            try:
+                board = chess.Board(fen)
+            except ValueError as error:
+                emit({'line': n, 'fen': fen, 'error': str(error)})
+                continue
+            # A FEN can parse and still be nonsense (no kings, pawns on the
+            # back rank, ...), which can crash the engine, so don't send it.
+            if not board.is_valid():
+                emit({'line': n, 'fen': fen, 'error': f"Invalid position: {board.status().name}"})
+                continue
+
+            # Every position gets the same limit here, so waiting on any
+            # in-flight search of the position will do.
+            key = cache.info_key(board)
+            info = cache.get_info(result_cache, board, limit)
+            if info is None and key in pending:
+                waits += 1
+                info = await pending[key]
+            if info is not None:
+                emit(result_line(n, fen, board, info, True))
+                continue
+
+            future = asyncio.get_running_loop().create_future()
+            pending[key] = future
+            try:
+                if criteria:
+                    info = await early_stop.analyse_early_stop(engines[i], board, limit, criteria, stats)
+                else:
+                    info = await engines[i].analyse(board, limit)
+            except chess.engine.EngineError as error:
+                # Failures aren't cached; anyone waiting searches it themselves
+                del pending[key]
+                future.set_result(None)
+                emit({'line': n, 'fen': fen, 'error': str(error)})
+                if isinstance(error, chess.engine.EngineTerminatedError):
+                    # The engine died; start a new one for the rest of the
+                    # input rather than failing everything after this.
+                    engines[i] = (await engine_pool.open_engines(args['binary'], 1, options))[0]
+                continue
+
+            del pending[key]
+            future.set_result(info)
+            cache.put_info(result_cache, board, limit, info)
+            emit(result_line(n, fen, board, info, False))
+
+    engines = await engine_pool.open_engines(args['binary'], processes, options)
+    try:
+        await asyncio.gather(produce(), *(consume(i) for i in range(len(engines))))
+    finally:
+        await engine_pool.close_engines(engines)
+        if infile is not sys.stdin:
+            infile.close()
+        if out is not sys.stdout:
+            out.close()
+
+    print(f"{result_cache.summary()}; {waits} waited on an in-flight search", file=sys.stderr)
+    if criteria:
+        print(stats.summary(), file=sys.stderr)
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Analyze positions given as FENs, one per line, writing JSON lines")
+    parser.add_argument("-i", "--input", default="-", help="File of FENs, one per line (default: stdin)")
+    parser.add_argument("-o", "--output", default="-", help="Where to write the JSON lines (default: stdout)")
+    parser.add_argument("-d", "--depth", default=18, type=int, help="Depth to analyze each position to")
+    parser.add_argument("-t", "--time", type=float, help="Maximum time per position (seconds)")
+    parser.add_argument("-s", "--hash-size", type=int, help="Set engine hash size in MB (default: autotuned, else 1024)")
+    parser.add_argument("-j", "--threads", type=int, help="Set engine Threads (default: autotuned)")
+    parser.add_argument("-P", "--processes", type=int, help="Number of engine processes (default: autotuned, else 1)")
+    parser.add_argument("--cache-mb", default=const.CACHE_MB, type=int, help="Size of the in-process result cache in MB")
+    early_stop.add_arguments(parser)
+    parser.add_argument("--binary", default=conf.DEFAULT_STOCKFISH_BIN, help="Engine binary")
+
+    args = vars(parser.parse_args(argv))
+
+    import asyncio
+    import chess.engine
+
+    asyncio.set_event_loop_policy(chess.engine.EventLoopPolicy())
+    asyncio.run(analyze_fens(args))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,22 @@
+#!/usr/bin/env python3.11
+
+# Deferred imports for the command line scripts. `chess` = lazy_import('chess')
+# gives back the module straight away but only actually loads it on first
+# attribute access, so things like --help don't pay for python-chess (and
+# chess.pgn/chess.engine pull in asyncio on top of that).
+
+import sys
+import importlib.util
+
+def lazy_import(name):
+    if name in sys.modules:
+        return sys.modules[name]
+
+    spec = importlib.util.find_spec(name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+
+    return module
@@ -0,0 +1,242 @@
+#!/usr/bin/env python3.11
+
+# Per-player statistics kept up to date across a corpus of analyzed games.
+#
+# async_analysis.py -o FILE writes one JSON line per ply. Those are ingested
+# here into running totals per player, per color and per game phase (ACPL,
+# count of each Category, blunders by move number) which are saved to
+# config.PLAYER_STATS_FILE. Adding games only adds to the totals; earlier
+# games are never looked at again, and games already ingested are skipped.
+# Reports are produced from the totals alone.
+
+import os
+import sys
+import csv
+import json
+import hashlib
+import argparse
+
+import chess
+
+import constants as const
+from constants import Category
+import config as conf
+
+PHASES = ('opening', 'middlegame', 'endgame')
+COLORS = ('white', 'black')
+
+def game_phase(board):
+    if board.fullmove_number <= const.PHASE_OPENING_MOVES:
+        return 'opening'
+
+    material = 0
+    for piece_type in (chess.KNIGHT, chess.BISHOP, chess.ROOK, chess.QUEEN):
+        count = len(board.pieces(piece_type, chess.WHITE)) + len(board.pieces(piece_type, chess.BLACK))
+        material += count * const.PIECE_VALUES[piece_type]
+
+    return 'endgame' if material <= const.PHASE_ENDGAME_MATERIAL else 'middlegame'
+
+def game_id(game):
+    # Stable across runs so the same game analyzed twice is only counted once.
+    h = hashlib.sha1()
+    for tag in ('Event', 'Site', 'Date', 'Round', 'White', 'Black', 'Result'):
+        h.update(f"{tag}={game.headers.get(tag, '?')};".encode())
+    h.update(' '.join(move.uci() for move in game.mainline_moves()).encode())
+    return h.hexdigest()
+
+def new_bucket():
+    return {
+            'plies': 0,
+            'cp_loss': 0,
+            'categories': {c.name: 0 for c in Category},
+            # move number (as a string, it's JSON) -> [plies, blunders]
+            'moves': {},
+           }
+
+class Player_Stats:
+    def __init__(self, path=conf.PLAYER_STATS_FILE):
+        self.path = path
+        self.games = set()
+        self.players = {}
+        self.load()
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path) as f:
+            state = json.load(f)
+        self.games = set(state['games'])
+        self.players = state['players']
+
+    def save(self):
+        # Write to a temp file first so an interrupted save can't lose the
+        # existing totals.
+        tmp = f"{self.path}.tmp"
+        with open(tmp, 'w') as f:
+            json.dump({'games': sorted(self.games), 'players': self.players}, f)
+        os.replace(tmp, self.path)
+
+    def player(self, name):
+        if name not in self.players:
+            self.players[name] = {color: {'games': 0, 'phases': {phase: new_bucket() for phase in PHASES}}
+                                  for color in COLORS}
+        return self.players[name]
+
+    def add_ply(self, record):
+        bucket = self.player(record['player'])[record['color']]['phases'][record['phase']]
+        bucket['plies'] += 1
+        bucket['cp_loss'] += min(max(record['cp_loss'], 0), const.ACPL_CAP_CP)
+        bucket['categories'][record['category']] += 1
+
+        move = bucket['moves'].setdefault(str(record['move_num']), [0, 0])
+        move[0] += 1
+        if record['category'] == Category.BLUNDER.name:
+            move[1] += 1
+
+    def add_game(self, records):
+        # All the per-ply records of one game. Returns False if the game was
+        # already counted.
+        if not records or records[0]['game_id'] in self.games:
+            return False
+
+        self.games.add(records[0]['game_id'])
+        first = records[0]
+        self.player(first['white'])['white']['games'] += 1
+        self.player(first['black'])['black']['games'] += 1
+        for record in records:
+            self.add_ply(record)
+
+        return True
+
+    def ingest(self, f):
+        # Records for a game are written together, so group consecutive lines
+        # by game_id. The -o file is appended to, so the same game analyzed
+        # twice in a row shows up as two blocks with the same game_id; a ply
+        # that doesn't follow on from the last one starts a new block.
+        added = skipped = 0
+        records = []
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if records and (record['game_id'] != records[0]['game_id'] or record['ply'] <= records[-1]['ply']):
+                if self.add_game(records):
+                    added += 1
+                else:
+                    skipped += 1
+                records = []
+            records.append(record)
+
+        if records:
+            if self.add_game(records):
+                added += 1
+            else:
+                skipped += 1
+
+        return added, skipped
+
+    def rows(self, player=None):
+        # One row per player/color/phase, plus an 'all' phase row per
+        # player/color.
+        rows = []
+        for name in sorted(self.players):
+            if player and name != player:
+                continue
+            for color in COLORS:
+                side = self.players[name][color]
+                total = new_bucket()
+                for phase in PHASES + ('all',):
+                    bucket = total if phase == 'all' else side['phases'][phase]
+                    if phase != 'all':
+                        total['plies'] += bucket['plies']
+                        total['cp_loss'] += bucket['cp_loss']
+                        for c, n in bucket['categories'].items():
+                            total['categories'][c] += n
+                    if not bucket['plies']:
+                        continue
+                    row = {
+                           'player': name,
+                           'color': color,
+                           'phase': phase,
+                           'games': side['games'],
+                           'plies': bucket['plies'],
+                           'acpl': round(bucket['cp_loss'] / bucket['plies'], 1),
+                          }
+                    for c in Category:
+                        row[c.name.lower()] = bucket['categories'][c.name]
+                    rows.append(row)
+
+        return rows
+
+    def blunder_rows(self, player=None):
+        # Blunder rate by move number per player/color, over all phases.
+        rows = []
+        for name in sorted(self.players):
+            if player and name != player:
+                continue
+            for color in COLORS:
+                moves = {}
+                for bucket in self.players[name][color]['phases'].values():
+                    for move_num, (plies, blunders) in bucket['moves'].items():
+                        m = moves.setdefault(int(move_num), [0, 0])
+                        m[0] += plies
+                        m[1] += blunders
+                for move_num in sorted(moves):
+                    plies, blunders = moves[move_num]
+                    rows.append({
+                                 'player': name,
+                                 'color': color,
+                                 'move_num': move_num,
+                                 'plies': plies,
+                                 'blunders': blunders,
+                                 'blunder_rate': round(blunders / plies, 4),
+                                })
+
+        return rows
+
+def write_report(rows, fmt, out):
+    if fmt == 'json':
+        json.dump(rows, out, indent=2)
+        out.write('\n')
+    elif rows:
+        writer = csv.DictWriter(out, fieldnames=list(rows[0].keys()))
+        writer.writeheader()
+        writer.writerows(rows)
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Per-player statistics over analyzed games")
+    parser.add_argument("-S", "--stats", default=conf.PLAYER_STATS_FILE, help="Statistics file to update/read")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    ingest = subparsers.add_parser("ingest", help="Add per-ply results (JSONL from async_analysis.py -o) to the totals")
+    ingest.add_argument("files", nargs="+", help="JSONL files; - for stdin")
+
+    report = subparsers.add_parser("report", help="Report the totals")
+    report.add_argument("-F", "--format", choices=("csv", "json"), default="csv", help="Report format")
+    report.add_argument("-b", "--blunders", action="store_true", help="Report blunder rate by move number instead")
+    report.add_argument("-p", "--player", help="Only this player")
+    report.add_argument("-o", "--output", help="Write the report here instead of stdout")
+
+    args = vars(parser.parse_args())
+
+    stats = Player_Stats(args['stats'])
+
+    if args['command'] == 'ingest':
+        for path in args['files']:
+            if path == '-':
+                added, skipped = stats.ingest(sys.stdin)
+            else:
+                with open(path) as f:
+                    added, skipped = stats.ingest(f)
+            print(f"{path}: {added} games added, {skipped} already counted")
+        stats.save()
+    else:
+        rows = stats.blunder_rows(args['player']) if args['blunders'] else stats.rows(args['player'])
+        if args['output']:
+            with open(args['output'], 'w', newline='') as out:
+                write_report(rows, args['format'], out)
+        else:
+            write_report(rows, args['format'], sys.stdout)
+
+if __name__ == "__main__":
+    main()
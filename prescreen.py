@@ -0,0 +1,143 @@
+#!/usr/bin/env python3.11
+
+# A static pre-screen for hanging pieces, using only python-chess move
+# generation and attack maps (no engine). One pass over the game flags the
+# plies that leave material en prise, which are the likely blunders, and the
+# quiet plies where nothing is hanging and nothing was captured. The engine
+# search budget can then be raised for the first and lowered for the second
+# (see search_limit()).
+#
+# "En prise" is decided by a static exchange evaluation: both sides keep
+# capturing on the square with their least valuable attacker, either side
+# free to stop, counted in const.PIECE_VALUES. X-rays through the capturing
+# pieces are seen; pins and checks elsewhere on the board are not, so this is
+# a screen, not a verdict.
+
+import chess
+
+import constants as const
+
+def value(piece_type):
+    return const.PIECE_VALUES[piece_type]
+
+def exchange_gain(board, square, color):
+    # Material `color` wins by starting a capture sequence on `square`
+    # (0 if it shouldn't start one).
+    board = board.copy(stack=False)
+    captured = []
+    on_square = board.piece_type_at(square)
+
+    while True:
+        attackers = board.attackers(color, square)
+        if not attackers:
+            break
+        attacker = min(attackers, key=lambda sq: value(board.piece_type_at(sq)))
+        piece_type = board.piece_type_at(attacker)
+        if piece_type == chess.KING and board.attackers(not color, square):
+            break
+
+        captured.append(value(on_square))
+        on_square = piece_type
+        board.remove_piece_at(attacker)
+        board.set_piece_at(square, chess.Piece(piece_type, color))
+        color = not color
+
+    if not captured:
+        return 0
+
+    # Swap list: gain[i] is the balance if the sequence stops after capture
+    # i, then unwind it letting each side decline a capture that loses.
+    gain = [captured[0]]
+    for i in range(1, len(captured)):
+        gain.append(captured[i] - gain[i-1])
+    for i in range(len(gain) - 1, 0, -1):
+        gain[i-1] = -max(-gain[i-1], gain[i])
+
+    return max(gain[0], 0)
+
+def hanging_pieces(board, color):
+    # [(square, piece, material the opponent wins)] for `color`'s pieces
+    hanging = []
+    for square, piece in board.piece_map().items():
+        if piece.color != color or piece.piece_type == chess.KING:
+            continue
+        if not board.is_attacked_by(not color, square):
+            continue
+        gain = exchange_gain(board, square, not color)
+        if gain > 0:
+            hanging.append((square, piece, gain))
+
+    return hanging
+
+def prescreen_game(game):
+    # One entry per ply, in game order. Only material that the move leaves
+    # hanging counts: a piece that was already en prise before the move (and
+    # no more so after it) was the previous ply's problem, and flagging it
+    # again on every ply until it's taken or saved just inflates the search.
+    flags = []
+    board = game.board()
+    # The mover's hanging pieces before the move, {(square, piece): gain};
+    # these are the opponent's from the previous ply's check below.
+    before = {(sq, piece): gain for sq, piece, gain in hanging_pieces(board, board.turn)}
+    for move in game.mainline_moves():
+        color = board.turn
+        move_num = board.fullmove_number
+        san = board.san(move)
+        is_capture = board.is_capture(move)
+        if board.is_en_passant(move):
+            taken = value(chess.PAWN)
+        elif is_capture:
+            taken = value(board.piece_type_at(move.to_square))
+        else:
+            taken = 0
+
+        board.push(move)
+
+        hanging = hanging_pieces(board, color)
+        opponent_hanging = hanging_pieces(board, not color)
+        new_hanging = [(sq, piece, gain) for sq, piece, gain in hanging if gain > before.get((sq, piece), 0)]
+        # A capture that can be recaptured isn't a loss unless the recapture
+        # wins more than was just taken.
+        at_stake = max((gain for _, _, gain in new_hanging), default=0) - taken
+        suspect = at_stake > 0
+        quiet = (not suspect and not is_capture and not board.is_check()
+                 and not hanging and not opponent_hanging)
+
+        flags.append({
+                      'ply': board.ply(),
+                      'move_num': move_num,
+                      'san': san,
+                      'color': color,
+                      'hanging': [(chess.square_name(sq), piece.symbol(), gain) for sq, piece, gain in new_hanging],
+                      'material': max(at_stake, 0),
+                      'suspect': suspect,
+                      'quiet': quiet,
+                     })
+
+        before = {(sq, piece): gain for sq, piece, gain in opponent_hanging}
+
+    return flags
+
+def search_limit(flag, depth=None, time=None):
+    # The search budget for one ply, given the base depth/time.
+    import chess.engine
+
+    if flag['suspect']:
+        if depth:
+            depth += const.PRESCREEN_DEPTH_BOOST
+        if time:
+            time *= const.PRESCREEN_TIME_SCALE
+    elif flag['quiet']:
+        if depth:
+            # Never below the floor, but the floor never raises a base depth
+            # that's already under it
+            depth = max(min(depth, const.PRESCREEN_MIN_DEPTH), depth - const.PRESCREEN_DEPTH_CUT)
+        if time:
+            time /= const.PRESCREEN_TIME_SCALE
+
+    return chess.engine.Limit(depth=depth, time=time)
+
+def alert(flag):
+    san = f"...{flag['san']}" if flag['color'] == chess.BLACK else flag['san']
+    pieces = ', '.join(f"{symbol}{square}" for square, symbol, _ in flag['hanging'])
+    return f"Hanging at move {flag['move_num']}, {san}: {pieces} (up to {flag['material']} pawns)"
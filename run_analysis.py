@@ -57,47 +57,64 @@ import datetime
 
 import logging
 
-from stockfish import Stockfish
-import chess
-import chess.pgn
-import chess.engine
-
 import constants as const
 from   constants import Category
 import config    as conf
+import early_stop
+from   lazy      import lazy_import
+
+# python-chess is only loaded once something actually uses it, and
+# chess.pgn/chess.engine (and the engine itself) only once they're needed, so
+# --help and the modes that never search start quickly.
+chess = lazy_import('chess')
+cache = lazy_import('cache')
+prescreen = lazy_import('prescreen')
+
+def setup_logging():
+    if not const.LOG_DIR:
+        const.LOG_DIR = '.'
+    elif not os.path.exists(const.LOG_DIR):
+        try:
+            os.mkdir(const.LOG_DIR)
+        except OSError as error:
+            print(error)
+            os._exit(1)
 
-if not const.LOG_DIR:
-    const.LOG_DIR = '.'
-elif not os.path.exists(const.LOG_DIR):
-    try:
-        os.mkdir(const.LOG_DIR)
-    except OSError as error:
-        print(error)
-        os._exit(1)
-
-date_str = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
-logging.basicConfig(filename=f"{const.LOG_DIR}/analysis.debug.{date_str}.log", level=logging.DEBUG)
+    date_str = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+    logging.basicConfig(filename=f"{const.LOG_DIR}/analysis.debug.{date_str}.log", level=logging.DEBUG)
 
 class Arguments:
-    def __init__(self):
+    def __init__(self, argv=None):
         self.parser = argparse.ArgumentParser(description="Arg Parse Stuff")
-        self.arguments = self.parse_arguments()
+        self.arguments = self.parse_arguments(argv)
         self.args = vars(self.arguments)
 
-    def parse_arguments(self):
+    def parse_arguments(self, argv=None):
         self.parser.add_argument("-f", "--file", help="PGN file to parse")
         self.parser.add_argument("-r", "--run-eval", action="store_true", help="Find evaluation swings")
         self.parser.add_argument("-l", "--list", action="store_true", help="Live moves")
         self.parser.add_argument("-e", "--elo", type=int, help="Set engine ELO")
         self.parser.add_argument("-n", "--print-fen", action="store_true", help="Print FEN")
+        self.parser.add_argument("-F", "--fen", help="Evaluate a single position given as a FEN (see fen_analysis.py for many)")
         self.parser.add_argument("-d", "--depth", type=int, help="Depth from which to do analysis")
         self.parser.add_argument("-t", "--time", type=float, help="Set minimum move time for evaluation")
-        self.parser.add_argument("-s", "--hash-size", default=2048, type=int, help="Set engine hash size in MB")
+        self.parser.add_argument("-s", "--hash-size", type=int, help="Set engine hash size in MB (default: autotuned, else 2048)")
+        self.parser.add_argument("-j", "--threads", type=int, help="Set engine Threads (default: autotuned, else 6)")
+        early_stop.add_arguments(self.parser)
+        self.parser.add_argument("-H", "--alert-hanging", action="store_true", help="Alert on moves that leave pieces hanging (no engine)")
+        self.parser.add_argument("--cache-mb", default=const.CACHE_MB, type=int, help="Size of the in-process result cache in MB")
         self.parser.add_argument("-b", "--show-best", action="store_true", help="Show best move at swing")
         # Positional arguments if wanted:
         # self.parser.add_argument("src", help="source")
         # self.parser.add_argument("dst", help="dest")
-        return self.parser.parse_args()
+        arguments = self.parser.parse_args(argv)
+
+        # -F is a single position, not a game, so there are no moves to go
+        # through
+        if arguments.fen and (arguments.run_eval or arguments.list or arguments.print_fen or arguments.alert_hanging):
+            self.parser.error("-F/--fen can't be combined with -r, -l, -n or -H")
+
+        return arguments
 
     @property
     def args(self):
@@ -139,15 +156,42 @@ class Stockfish_PythonChess(Engine_Analysis):
     def __init__(self, args, binary=conf.DEFAULT_STOCKFISH_BIN):
         Engine_Analysis.__init__(self, binary)
         self.args = args
-        self.engine = chess.engine.SimpleEngine.popen_uci(self.binary)
+
+        # The engine is started (and its Hash allocated) the first time
+        # self.engine is used; see start_engine().
+        self._engine = None
+
+        self.cache = cache.LRU_Cache(self.args.args['cache_mb'] * 1024 * 1024)
+
+        self.early_stop_criteria = early_stop.criteria_from_args(self.args.args)
+        self.early_stop_stats = early_stop.Early_Stop_Stats()
 
         # TODO: args.args is ridiculous; fix this
-        self.pgn_file = self.args.args['file']
-        if self.pgn_file:
-            self.pgn = open(self.pgn_file)
+        if self.args.args['fen']:
+            # A single position, so there's no game to read
+            self.pgn_file = None
+            self.game = None
+            self.set_position(self.args.args['fen'])
         else:
-            print("Using the test PGN file")
-            self.pgn = open("test_game.pgn")
+            self.pgn_file = self.args.args['file']
+            if self.pgn_file:
+                self.pgn = open(self.pgn_file)
+            else:
+                print("Using the test PGN file")
+                self.pgn = open("test_game.pgn")
+
+            import chess.pgn
+            self.game = chess.pgn.read_game(self.pgn)
+            self.board = self.game.board()
+
+        print("Config options:")
+        print(self.args.args)
+
+    def start_engine(self):
+        import chess.engine
+        import autotune
+
+        self._engine = chess.engine.SimpleEngine.popen_uci(self.binary)
 
         if self.args.args['depth']:
             self.set_depth(self.args.args['depth'])
@@ -155,20 +199,27 @@ class Stockfish_PythonChess(Engine_Analysis):
             self.set_move_time_min(self.args.args['time'])
         if self.args.args['elo']:
             self.set_elo(self.args.args['elo'])
-        if self.args.args['hash_size']:
-            self.set_hash(self.args.args['hash_size'])
-
-        self.set_threads(6)
 
-        self.game = chess.pgn.read_game(self.pgn)
-        self.board = self.game.board()
+        # Hash and Threads come from the command line, then from the last
+        # autotune.py run on this host, then the old hardcoded values. Only
+        # one engine runs here, so it's the best single-process combination
+        # that applies, not the overall best (which may split the CPUs over
+        # several engines).
+        tuned = autotune.load_tuned_config(single_process=True) or {}
+        self.set_hash(self.args.args['hash_size'] or tuned.get('hash', 2048))
+        self.set_threads(self.args.args['threads'] or tuned.get('threads', 6))
 
-        print("Config options:")
-        print(self.args.args)
         print("Engine options:")
-        print(self.engine.options)
+        print(self._engine.options)
 #        print(f"chess.engine.Limit: {chess.engine.Limit}")
 
+        return self._engine
+
+    def close(self):
+        if self._engine is not None:
+            self._engine.close()
+            self._engine = None
+
     @property
     def game(self):
         return self._game
@@ -187,6 +238,8 @@ class Stockfish_PythonChess(Engine_Analysis):
 
     @property
     def engine(self):
+        if self._engine is None:
+            self.start_engine()
         return self._engine
 
     @engine.setter
@@ -238,8 +291,9 @@ class Stockfish_PythonChess(Engine_Analysis):
         self.prev_board = copy.deepcopy(self.board)
         self.color_played = self.prev_board.turn
         self.san = self.board.san(move)
+        self.board.push(move)
 
-        return self.board.san_and_push(move)
+        return self.san
 
     def moves(self):
         return self.game.mainline_moves()
@@ -309,8 +363,20 @@ class Stockfish_PythonChess(Engine_Analysis):
     def eval_move(self, move):
         # TODO: what is the right/best way to handle the `chess.engine.Limit`
         # thing? Is there no way to configure this per instance of engine?
-        return self.engine.analyse(self.board, chess.engine.Limit)
+        engine = self.engine
+        info = cache.get_info(self.cache, self.board, chess.engine.Limit)
+        if info is not None:
+            return info
+
+        if self.early_stop_criteria:
+            info = early_stop.analyse_early_stop_sync(engine, self.board, chess.engine.Limit,
+                                                      self.early_stop_criteria, self.early_stop_stats)
+        else:
+            info = engine.analyse(self.board, chess.engine.Limit)
         #return self.engine.analysis(self.board, chess.engine.Limit)
+        cache.put_info(self.cache, self.board, chess.engine.Limit, info)
+
+        return info
 
     def best_move(self, b=None):
         # Typically we are going to analyze the previous position for the best
@@ -320,11 +386,34 @@ class Stockfish_PythonChess(Engine_Analysis):
         if b == None:
             b = self.prev_board
         try:
-            bm = str(b.san(self.engine.play(b, chess.engine.Limit).move))
+            # The previous position was evaluated on the last move, so its
+            # best move is usually already in the cache.
+            engine = self.engine
+            info = cache.get_info(self.cache, b, chess.engine.Limit)
+            if info is not None and info.get('pv'):
+                return b.san(info['pv'][0])
+            bm = str(b.san(engine.play(b, chess.engine.Limit).move))
             return bm
         except:
             return None
 
+    def set_position(self, fen):
+        try:
+            board = chess.Board(fen)
+        except ValueError as error:
+            print(f"Invalid FEN, {fen}: {error}")
+            os._exit(1)
+        # A FEN can parse and still be nonsense (no kings, pawns on the back
+        # rank, ...), which can crash the engine, so don't send it.
+        if not board.is_valid():
+            print(f"Invalid position, {fen}: {board.status().name}")
+            os._exit(1)
+        self.board = board
+
+    def best_move_fen(self, fen):
+        self.set_position(fen)
+        return self.best_move(self.board)
+
     def evaluate_centipawns(self, curr_score, prev_score):
         # This is what the python-chess docs say about comparing two
         # consecutive scores of the players:
@@ -368,6 +457,8 @@ class Stockfish_Stockfish(Engine_Analysis):
     def __init__(self, binary=conf.DEFAULT_STOCKFISH_BIN):
         Engine_Analysis.__init__(self, binary)
 
+        from stockfish import Stockfish
+
         # Can set the strength of Stockfish to something more comparable to the ELO of
         # the players in the game so stockfish evaluates based on that ELO. Could be
         # useful. (actually not sure this affects position evaluation)
@@ -415,91 +506,130 @@ def is_an_int(n):
     except ValueError:
         return False
 
-args = Arguments()
-schach = Stockfish_PythonChess(args)
-
-#print(f"config: {schach.args.args}")
-
-if schach.run_centipawn():
-    previous_valuation = 0
-    for move in schach.moves():
-        # At this point we are at the previous move, or before the move stored in
-        # `move` has actually been made (pushed) on the board, so anything about
-        # the board is for the previous move (or starting position on the first
-        # time)
-
-        # Get the move number (as opposed to ply) before making the move (push)
-        # on the board, as otherwise the number will be off.
-        move_num = schach.fullmove_number()
-
-        # Put the move on the board so that board represents the move just made
-        # (the move we're "on"). This makes it the next player's turn, so
-        # everything is from the perspective of the opposite color from who
-        # just made this move. So we call san_and_push to retrieve the san of
-        # the move just made while playing the move on the board.
-        san = schach.san_and_push(move)
-        ply = schach.ply()
-
-        # Get the evaluation of the position of the move just played
-        eval_info = schach.eval_move(move)
-
-        # Normalize on white's perspective so a positive number means White's
-        # advantage and a negative number means Black's advanatage - makes
-        # things much easier and took me a while to realize this was possible
-        # and easier to do.
-        valuation = str(eval_info['score'].white().score())
-
-        if is_an_int(valuation):
-            valuation = int(valuation)
-
-            # This may go bye bye, but for now I wanted to be able to list the
-            # moves along with the evaluation.
-            if schach.args.args['list']:
-                if schach.color_played == chess.WHITE: print(f"{move_num}: ", end="")
-                print(f"{san} ", end="")
-                if schach.color_played == chess.BLACK: print("")
-
-            # For printing the FEN, each move on separate line
+def main(argv=None) -> None:
+    args = Arguments(argv)
+    schach = Stockfish_PythonChess(args)
+
+    #print(f"config: {schach.args.args}")
+
+    # Alerts for hanging pieces are static (no engine), so they're worked out
+    # up front and printed alongside the -r output, or on their own.
+    hanging_flags = None
+    if schach.args.args['alert_hanging'] and schach.game:
+        hanging_flags = prescreen.prescreen_game(schach.game)
+
+    if schach.run_centipawn():
+        setup_logging()
+        previous_valuation = 0
+        for i, move in enumerate(schach.moves()):
+            # At this point we are at the previous move, or before the move stored in
+            # `move` has actually been made (pushed) on the board, so anything about
+            # the board is for the previous move (or starting position on the first
+            # time)
+
+            # Get the move number (as opposed to ply) before making the move (push)
+            # on the board, as otherwise the number will be off.
+            move_num = schach.fullmove_number()
+
+            # Put the move on the board so that board represents the move just made
+            # (the move we're "on"). This makes it the next player's turn, so
+            # everything is from the perspective of the opposite color from who
+            # just made this move. So we call san_and_push to retrieve the san of
+            # the move just made while playing the move on the board.
+            san = schach.san_and_push(move)
+            ply = schach.ply()
+
+            # One flag per move of the game, which needn't start at ply 0
+            if hanging_flags and hanging_flags[i]['suspect']:
+                print(prescreen.alert(hanging_flags[i]))
+
+            # Get the evaluation of the position of the move just played
+            eval_info = schach.eval_move(move)
+
+            # Normalize on white's perspective so a positive number means White's
+            # advantage and a negative number means Black's advanatage - makes
+            # things much easier and took me a while to realize this was possible
+            # and easier to do.
+            valuation = str(eval_info['score'].white().score())
+
+            if is_an_int(valuation):
+                valuation = int(valuation)
+
+                # This may go bye bye, but for now I wanted to be able to list the
+                # moves along with the evaluation.
+                if schach.args.args['list']:
+                    if schach.color_played == chess.WHITE: print(f"{move_num}: ", end="")
+                    print(f"{san} ", end="")
+                    if schach.color_played == chess.BLACK: print("")
+
+                # For printing the FEN, each move on separate line
+                if schach.args.args['print_fen']:
+                    if schach.color_played == chess.WHITE:
+                        print(f"{move_num}:  {san} (fen: {schach.fen()})")
+                    else:
+                        print(f"...: {san} (fen: {schach.fen()})")
+
+                cp_category = schach.evaluate_centipawns(valuation, previous_valuation)
+                if cp_category == Category.INACCURATE:
+                    print("Inaccuracy ", end='')
+                elif cp_category == Category.MISTAKE:
+                    print("Mistake ", end='')
+                elif cp_category == Category.BLUNDER:
+                    print("Blunder ", end='')
+
+                if cp_category != Category.OK:
+                    san = f"...{san}" if schach.color_played == chess.BLACK else san
+                    print(f"at move {move_num}, {san} ({valuation})", end='')
+        
+                    if schach.args.args['show_best']:
+                        print(f". Engine suggests {schach.best_move()}.")
+                    else:
+                        print('')  # newline
+
+                previous_valuation = valuation
+            else:
+                valuation = str(eval_info['score'].white().mate())
+                print(f"#{valuation} at move {move_num}, {san}")
+
+                # Make up something totally arbitrary but showing the significance
+                # of mate possibility, giving higher value to lower numbers (mate
+                # in 1 is almost infinitely better than mate in 3). Of course just
+                # subtracting valuation from MATE_IN_ONE_CP works also, but not
+                # quite as different from mate in 1 to mate in 2.
+                # e.g., eval['score'].white().score(mate_score=const.MATE_IN_ONE_CP)
+                previous_valuation = const.MATE_IN_ONE_CP-(int(valuation)*const.MATE_CP_SCALE)
+        if schach.early_stop_criteria:
+            logging.info(f"Early stop criteria: {schach.early_stop_criteria}")
+            schach.early_stop_stats.log()
+        logging.info(schach.cache.summary())
+        schach.close()
+    elif schach.args.args['fen']:
+        setup_logging()
+        eval_info = schach.eval_move(None)
+        pv = eval_info.get('pv')
+        best = schach.board.san(pv[0]) if pv else None
+        print(f"{schach.fen()}: {eval_info['score'].white()} (depth {eval_info.get('depth')}). Engine suggests {best}.")
+        schach.close()
+    elif hanging_flags is not None:
+        for flag in hanging_flags:
+            if flag['suspect']:
+                print(prescreen.alert(flag))
+    elif schach.run_list_moves() or schach.args.args['print_fen']:
+        # Neither of these needs the engine, so it's never started
+        for move in schach.moves():
+            move_num = schach.fullmove_number()
+            color = schach.board.turn
+            san = schach.board.san(move)
+            if schach.run_list_moves():
+                print(f"move = {move}; san = {san}")
+            schach.board.push(move)
             if schach.args.args['print_fen']:
-                if schach.color_played == chess.WHITE:
+                if color == chess.WHITE:
                     print(f"{move_num}:  {san} (fen: {schach.fen()})")
                 else:
                     print(f"...: {san} (fen: {schach.fen()})")
+    else:
+        print("Nothing to do. Did you provide an action?")
 
-            cp_category = schach.evaluate_centipawns(valuation, previous_valuation)
-            if cp_category == Category.INACCURATE:
-                print("Inaccuracy ", end='')
-            elif cp_category == Category.MISTAKE:
-                print("Mistake ", end='')
-            elif cp_category == Category.BLUNDER:
-                print("Blunder ", end='')
-
-            if cp_category != Category.OK:
-                san = f"...{san}" if schach.color_played == chess.BLACK else san
-                print(f"at move {move_num}, {san} ({valuation})", end='')
-        
-                if schach.args.args['show_best']:
-                    print(f". Engine suggests {schach.best_move()}.")
-                else:
-                    print('')  # newline
-
-            previous_valuation = valuation
-        else:
-            valuation = str(eval_info['score'].white().mate())
-            print(f"#{valuation} at move {move_num}, {san}")
-
-            # Make up something totally arbitrary but showing the significance
-            # of mate possibility, giving higher value to lower numbers (mate
-            # in 1 is almost infinitely better than mate in 3). Of course just
-            # subtracting valuation from MATE_IN_ONE_CP works also, but not
-            # quite as different from mate in 1 to mate in 2.
-            # e.g., eval['score'].white().score(mate_score=const.MATE_IN_ONE_CP)
-            previous_valuation = const.MATE_IN_ONE_CP-(int(valuation)*const.MATE_CP_SCALE)
-    schach.engine.close()
-elif schach.run_list_moves():
-    for move in schach.moves():
-        print(f"move = {move}; san = {schach.board.san(move)}")
-        schach.board.push(move)
-    schach.engine.close()
-else:
-    print("Nothing to do. Did you provide an action?")
+if __name__ == "__main__":
+    main()
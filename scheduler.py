@@ -0,0 +1,96 @@
+#!/usr/bin/env python3.11
+
+# Decide which engine analyzes which plies of a game, and in what order.
+#
+# Neighbouring plies share most of their search trees, so an engine that
+# analyzes them one after the other finds much of the work already in its
+# hash (transposition table). Handing plies out one at a time to whichever
+# engine is free (engine_pool.run_pool) scatters neighbours across engines and
+# throws that away. Here the game is cut into contiguous segments and each
+# segment is analyzed start to finish by one engine.
+#
+# Inside a segment the default is to go backwards, from the last ply to the
+# first: the search from a position runs through the position after it, which
+# has then already been searched to full depth. Each ply searches the
+# position before its move and then the one after, and the one after is the
+# position before the next ply, searched three searches earlier (before and
+# after the next ply, then before this one). 'forward' is there to compare
+# against.
+#
+# This is not the default in async_analysis.py (--schedule segments) until
+# bench_schedule.py has shown it needing fewer nodes with a real engine.
+
+import asyncio
+
+import constants as const
+
+ORDERS = ('backward', 'forward')
+HASH_POLICIES = ('clear', 'resize', 'keep')
+
+def split_segments(n, segments):
+    # Cut range(n) into `segments` contiguous, nearly equal pieces (fewer if
+    # there are fewer than `segments` items).
+    segments = max(1, min(segments, n))
+    size, extra = divmod(n, segments)
+    bounds = []
+    start = 0
+    for i in range(segments):
+        end = start + size + (1 if i < extra else 0)
+        if end > start:
+            bounds.append(range(start, end))
+        start = end
+
+    return bounds
+
+def segment_order(segment, order='backward'):
+    if order == 'backward':
+        return list(reversed(segment))
+    elif order == 'forward':
+        return list(segment)
+    else:
+        raise ValueError(f"Invalid segment order: {order}")
+
+async def run_segments(engines, items, worker, order='backward', segments_per_engine=1):
+    # Like engine_pool.run_pool(), but `items` (in game order) are split into
+    # contiguous segments and an engine works through a whole segment before
+    # taking the next. One segment per engine keeps the most neighbours
+    # together; more segments per engine trades some of that for better load
+    # balancing. Results come back in the same order as `items`.
+    queue = asyncio.Queue()
+    for segment in split_segments(len(items), len(engines) * segments_per_engine):
+        queue.put_nowait(segment_order(segment, order))
+
+    results = [None] * len(items)
+
+    async def consume(engine):
+        while True:
+            try:
+                segment = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            for i in segment:
+                results[i] = await worker(engine, items[i])
+
+    await asyncio.gather(*(consume(engine) for engine in engines))
+
+    return results
+
+def hash_for_game(plies, max_hash):
+    size = 16
+    while size < plies * const.HASH_MB_PER_PLY and size < max_hash:
+        size *= 2
+    return min(size, max_hash)
+
+async def reset_hash(engines, policy='clear', hash_size=None):
+    # Called between games. Positions from one game are rarely any use for the
+    # next, and stale entries just crowd out new ones, so by default the hash
+    # is cleared. 'resize' sets Hash to `hash_size` (see hash_for_game(); this
+    # also clears it in Stockfish); 'keep' leaves it alone.
+    if policy == 'keep':
+        return
+
+    for engine in engines:
+        if policy == 'resize' and hash_size and engine.config.get('Hash') != hash_size:
+            await engine.configure({"Hash": hash_size})
+        elif 'Clear Hash' in engine.options:
+            await engine.configure({"Clear Hash": None})
@@ -0,0 +1,90 @@
+import chess
+import chess.engine
+
+import cache
+from cache import LRU_Cache
+
+Limit = chess.engine.Limit
+
+def test_deeper_result_serves_shallower_request():
+    c = LRU_Cache()
+    board = chess.Board()
+    cache.put_info(c, board, Limit(depth=20), {'depth': 20})
+
+    assert cache.get_info(c, board, Limit(depth=16)) == {'depth': 20}
+    assert cache.get_info(c, board, Limit(depth=20)) == {'depth': 20}
+    assert cache.get_info(c, board, Limit(depth=24)) is None
+    assert c.stats()['kinds']['info'] == {'hits': 2, 'misses': 1, 'hit_rate': 2 / 3}
+
+def test_shallower_result_does_not_serve_deeper_request():
+    c = LRU_Cache()
+    board = chess.Board()
+    cache.put_info(c, board, Limit(depth=12), {'depth': 12})
+    assert cache.get_info(c, board, Limit(depth=16)) is None
+
+def test_limit_covers():
+    assert cache.limit_covers((20, None, None, None), (16, 1.0, None, None))
+    assert not cache.limit_covers((20, 1.0, None, None), (16, None, None, None))
+    assert not cache.limit_covers((20, 1.0, None, None), (16, 2.0, None, None))
+    assert not cache.limit_covers((20, None, None, 3), (16, None, None, None))
+
+def test_shallower_put_keeps_deeper_entry():
+    c = LRU_Cache()
+    board = chess.Board()
+    cache.put_info(c, board, Limit(depth=20), {'depth': 20})
+    cache.put_info(c, board, Limit(depth=12), {'depth': 12})
+    assert cache.get_info(c, board, Limit(depth=12)) == {'depth': 20}
+
+    # A deeper one does replace it
+    cache.put_info(c, board, Limit(depth=24), {'depth': 24})
+    assert cache.get_info(c, board, Limit(depth=20)) == {'depth': 24}
+    assert len(c.entries) == 1
+
+def test_repeated_position_not_stored():
+    c = LRU_Cache()
+    board = chess.Board()
+    for move in ('g1f3', 'g8f6', 'f3g1', 'f6g8'):
+        board.push_uci(move)
+
+    assert cache.info_key(board) is None
+    cache.put_info(c, board, Limit(depth=10), {'depth': 10})
+    assert len(c.entries) == 0
+    assert cache.get_info(c, board, Limit(depth=10)) is None
+
+    # The starting position without the history is still cached as usual
+    cache.put_info(c, chess.Board(), Limit(depth=10), {'depth': 10})
+    assert len(c.entries) == 1
+
+def test_halfmove_clock_in_key():
+    assert cache.info_key(chess.Board()) != cache.info_key(chess.Board(chess.STARTING_FEN.replace(' 0 1', ' 40 1')))
+
+def test_eviction_keeps_under_cap():
+    value = 'x' * 1000
+    size = cache.approx_size(('k', 0)) + cache.approx_size(value)
+    c = LRU_Cache(max_bytes=size * 3)
+
+    for i in range(10):
+        c.put(('k', i), value)
+        assert c.bytes <= c.max_bytes
+
+    assert len(c.entries) == 3
+    assert c.evictions == 7
+    # Least recently used go first
+    assert c.get(('k', 0)) is None
+    assert c.get(('k', 9)) == value
+
+def test_lru_order():
+    value = 'x' * 1000
+    size = cache.approx_size(('k', 0)) + cache.approx_size(value)
+    c = LRU_Cache(max_bytes=size * 2)
+    c.put(('k', 0), value)
+    c.put(('k', 1), value)
+    c.get(('k', 0))
+    c.put(('k', 2), value)
+    assert c.get(('k', 1)) is None
+    assert c.get(('k', 0)) == value
+
+def test_oversized_value_not_stored():
+    c = LRU_Cache(max_bytes=100)
+    c.put(('k', 0), 'x' * 1000)
+    assert len(c.entries) == 0 and c.bytes == 0
@@ -0,0 +1,54 @@
+import argparse
+
+import chess
+import chess.engine
+
+import early_stop
+from early_stop import Stop_Criteria, Early_Stop_Tracker
+
+A = chess.Move.from_uci('e2e4')
+B = chess.Move.from_uci('d2d4')
+
+def info(depth, move, cp=None, mate=None):
+    score = chess.engine.Mate(mate) if mate is not None else chess.engine.Cp(cp)
+    return {'depth': depth, 'score': chess.engine.PovScore(score, chess.WHITE), 'pv': [move]}
+
+def feed(tracker, lines):
+    return [tracker.update(info(*line)) for line in lines]
+
+def test_stable_after_k_depths():
+    tracker = Early_Stop_Tracker(Stop_Criteria(tolerance_cp=15, stable_depths=3, min_depth=1))
+    assert feed(tracker, [(1, A, 10), (2, A, 20), (3, A, 12)]) == [None, None, 'stable']
+
+def test_score_swing_resets():
+    tracker = Early_Stop_Tracker(Stop_Criteria(tolerance_cp=15, stable_depths=3, min_depth=1))
+    assert feed(tracker, [(1, A, 10), (2, A, 10), (3, A, 100), (4, A, 100)]) == [None, None, None, None]
+
+def test_min_depth():
+    tracker = Early_Stop_Tracker(Stop_Criteria(tolerance_cp=15, stable_depths=2, min_depth=4))
+    assert feed(tracker, [(1, A, 10), (2, A, 10), (3, A, 10), (4, A, 10)]) == [None, None, None, 'stable']
+
+def test_same_depth_replacement_is_checked():
+    # The second depth 2 line replaces the first; B has then only been seen
+    # at two depths, after a big swing, which isn't stable.
+    tracker = Early_Stop_Tracker(Stop_Criteria(tolerance_cp=15, stable_depths=3, min_depth=1))
+    assert feed(tracker, [(1, A, 10), (2, A, 10), (2, B, 300), (3, B, 305)]) == [None, None, None, None]
+    assert tracker.update(info(4, B, 300)) == 'stable'
+
+def test_same_depth_repeat_does_not_count():
+    tracker = Early_Stop_Tracker(Stop_Criteria(tolerance_cp=15, stable_depths=3, min_depth=1))
+    assert feed(tracker, [(1, A, 10), (2, A, 10), (2, A, 12)]) == [None, None, None]
+
+def test_mate():
+    tracker = Early_Stop_Tracker(Stop_Criteria(min_depth=1))
+    assert tracker.update(info(1, A, mate=3)) == 'mate'
+    tracker = Early_Stop_Tracker(Stop_Criteria(stable_depths=3, min_depth=1, stop_on_mate=False))
+    assert tracker.update(info(1, A, mate=3)) is None
+
+def test_criteria_from_args():
+    parser = argparse.ArgumentParser()
+    early_stop.add_arguments(parser)
+    assert early_stop.criteria_from_args(vars(parser.parse_args([]))) is None
+    criteria = early_stop.criteria_from_args(vars(parser.parse_args(['-x', '--stop-depths', '5', '--no-stop-on-mate'])))
+    assert criteria.stable_depths == 5
+    assert not criteria.stop_on_mate
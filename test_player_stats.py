@@ -0,0 +1,53 @@
+import io
+import json
+
+from player_stats import Player_Stats
+
+def game_lines(game_id, plies=4):
+    lines = []
+    for ply in range(1, plies + 1):
+        white = ply % 2 == 1
+        lines.append(json.dumps({
+                                 'game_id': game_id,
+                                 'white': 'Alice',
+                                 'black': 'Bob',
+                                 'date': '2024.01.01',
+                                 'player': 'Alice' if white else 'Bob',
+                                 'color': 'white' if white else 'black',
+                                 'ply': ply,
+                                 'move_num': (ply + 1) // 2,
+                                 'phase': 'opening',
+                                 'san': 'e4',
+                                 'best': 'e4',
+                                 'player_eval': 0,
+                                 'best_eval': 100,
+                                 'cp_loss': 100,
+                                 'category': 'BLUNDER' if ply == 1 else 'OK',
+                                 'depth': 10,
+                                }))
+    return '\n'.join(lines) + '\n'
+
+def test_ingest_same_game_twice(tmp_path):
+    stats = Player_Stats(tmp_path / 'stats.json')
+
+    # The same game analyzed twice in a row, appended to one file
+    assert stats.ingest(io.StringIO(game_lines('g1') * 2)) == (1, 1)
+    # ...and ingested again later
+    assert stats.ingest(io.StringIO(game_lines('g1'))) == (0, 1)
+
+    white = stats.players['Alice']['white']
+    assert white['games'] == 1
+    assert white['phases']['opening']['plies'] == 2
+    assert white['phases']['opening']['cp_loss'] == 200
+    assert white['phases']['opening']['categories']['BLUNDER'] == 1
+    assert stats.players['Bob']['black']['phases']['opening']['plies'] == 2
+
+def test_ingest_survives_save(tmp_path):
+    path = tmp_path / 'stats.json'
+    stats = Player_Stats(path)
+    assert stats.ingest(io.StringIO(game_lines('g1') + game_lines('g2'))) == (2, 0)
+    stats.save()
+
+    stats = Player_Stats(path)
+    assert stats.ingest(io.StringIO(game_lines('g2'))) == (0, 1)
+    assert stats.players['Alice']['white']['games'] == 2
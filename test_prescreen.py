@@ -0,0 +1,72 @@
+import io
+
+import chess
+import chess.pgn
+
+import constants as const
+import prescreen
+
+def test_exchange_gain_defended_pawn():
+    board = chess.Board('k7/8/8/3n4/8/4P3/3P4/K7 w - - 0 1')
+    # Nxe3 dxe3 loses the knight for a pawn
+    assert prescreen.exchange_gain(board, chess.E3, chess.BLACK) == 0
+    board.remove_piece_at(chess.D2)
+    assert prescreen.exchange_gain(board, chess.E3, chess.BLACK) == 1
+
+def test_exchange_gain_xray_battery():
+    board = chess.Board('k3r3/4p3/8/8/8/8/4R3/K3R3 w - - 0 1')
+    # Rxe7 Rxe7 Rxe7: the second rook behind the first wins the pawn
+    assert prescreen.exchange_gain(board, chess.E7, chess.WHITE) == 1
+    board.remove_piece_at(chess.E1)
+    assert prescreen.exchange_gain(board, chess.E7, chess.WHITE) == 0
+
+def test_exchange_gain_king_recapture():
+    board = chess.Board('8/8/4k3/3p4/8/2N5/8/K7 w - - 0 1')
+    # Nxd5 Kxd5
+    assert prescreen.exchange_gain(board, chess.D5, chess.WHITE) == 0
+    # ...but the king can't recapture on a square the rook covers
+    board.set_piece_at(chess.D1, chess.Piece(chess.ROOK, chess.WHITE))
+    assert prescreen.exchange_gain(board, chess.D5, chess.WHITE) == 1
+
+def test_hanging_pieces():
+    board = chess.Board('k7/8/3p4/4N3/8/8/7P/K7 w - - 0 1')
+    assert prescreen.hanging_pieces(board, chess.WHITE) == [(chess.E5, chess.Piece(chess.KNIGHT, chess.WHITE), 3)]
+    assert prescreen.hanging_pieces(board, chess.BLACK) == []
+
+def game_from(fen, moves):
+    return chess.pgn.read_game(io.StringIO(f'[SetUp "1"]\n[FEN "{fen}"]\n\n{moves} *\n'))
+
+def test_prescreen_only_flags_newly_hanging():
+    # The knight on e5 is already en prise when White moves; 1. h3 doesn't
+    # change that, 2. Nc6 puts it en prise somewhere new.
+    game = game_from('k7/8/3p4/4N3/8/8/7P/K7 w - - 0 1', '1. h3 Kb7 2. Nc6')
+    flags = prescreen.prescreen_game(game)
+
+    assert [flag['suspect'] for flag in flags] == [False, False, True]
+    assert flags[0]['hanging'] == []
+    assert flags[2]['hanging'] == [('c6', 'N', 3)]
+    assert flags[2]['material'] == 3
+
+def test_prescreen_quiet():
+    flags = prescreen.prescreen_game(game_from(chess.STARTING_FEN, '1. Nf3 Nf6'))
+    assert [flag['quiet'] for flag in flags] == [True, True]
+
+def flag(suspect=False, quiet=False):
+    return {'suspect': suspect, 'quiet': quiet}
+
+def test_search_limit_quiet_floor():
+    floor = const.PRESCREEN_MIN_DEPTH
+    cut = const.PRESCREEN_DEPTH_CUT
+    # Below the floor: never raised
+    assert prescreen.search_limit(flag(quiet=True), floor - 4).depth == floor - 4
+    # At the floor: unchanged
+    assert prescreen.search_limit(flag(quiet=True), floor).depth == floor
+    # Above it: cut, but not below the floor
+    assert prescreen.search_limit(flag(quiet=True), floor + 2).depth == floor
+    assert prescreen.search_limit(flag(quiet=True), floor + cut + 4).depth == floor + 4
+
+def test_search_limit_suspect_and_time():
+    assert prescreen.search_limit(flag(suspect=True), 4).depth == 4 + const.PRESCREEN_DEPTH_BOOST
+    assert prescreen.search_limit(flag(), 12).depth == 12
+    limit = prescreen.search_limit(flag(quiet=True), time=1.0)
+    assert limit.depth is None and limit.time == 1.0 / const.PRESCREEN_TIME_SCALE